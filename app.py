@@ -1,9 +1,12 @@
 import streamlit as st
+import io
 import os
+import queue
+import shutil
 import tempfile
+import threading
 import time
-import shutil
-from main import compress_gif, convert_mp4_to_gif  # Import both functions
+from concurrent.futures import ThreadPoolExecutor
 
 # Set page config
 st.set_page_config(
@@ -12,6 +15,108 @@ st.set_page_config(
     layout="centered",
 )
 
+@st.cache_resource(show_spinner=False)
+def _load_compressor():
+    """
+    Import the compression functions on first use.
+
+    main pulls in Pillow and NumPy, so loading the page doesn't wait for
+    them; the import happens once, when the first file is processed.
+    """
+    from main import compress_gif, convert_mp4_to_gif_bytes
+
+    return compress_gif, convert_mp4_to_gif_bytes
+
+
+@st.cache_resource(show_spinner=False)
+def _ffmpeg_available():
+    """Check once whether FFmpeg is on the PATH."""
+    return shutil.which("ffmpeg") is not None
+
+
+class CompressionCancelled(Exception):
+    """Raised when a compression is stopped before it finished."""
+
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def _cached_compress(file_bytes, params, _progress_queue=None, _stop_event=None):
+    """
+    Compress GIF bytes, memoized on the file contents and compression settings.
+
+    Repeat clicks with the same upload and settings return the cached result
+    instead of re-running the adaptive compression loop. The underscored
+    arguments are not part of the cache key.
+
+    Args:
+        file_bytes (bytes): GIF data to compress
+        params (tuple): Compression settings passed on to compress_gif
+        _progress_queue (queue.Queue, optional): Receives an
+            (attempt, size_mb, settings_info) tuple after each attempt
+        _stop_event (threading.Event, optional): Cancels the compression once set
+
+    Returns:
+        tuple: Compressed GIF bytes, original size and new size in bytes
+    """
+    (
+        target_size_mb,
+        max_attempts,
+        min_scale,
+        min_colors,
+        frame_sample_rate,
+        duration_factor,
+        force_scaling,
+        crop_pixels,
+        max_lossy,
+        shared_palette,
+        delta_frames,
+        smooth,
+        ffmpeg_encoder,
+        near_dup_tol,
+        target_tolerance,
+        early_stop_tol,
+    ) = params
+
+    # Keep the whole round trip in memory instead of temp files
+    compress_gif, _ = _load_compressor()
+    output_buffer = io.BytesIO()
+    progress_callback = None
+    if _progress_queue is not None:
+        progress_callback = lambda *update: _progress_queue.put(update)
+
+    orig_size, new_size = compress_gif(
+        io.BytesIO(file_bytes),
+        output_buffer,
+        target_size_mb=target_size_mb,
+        max_attempts=max_attempts,
+        progress_callback=progress_callback,
+        min_scale=min_scale,
+        min_colors=min_colors,
+        frame_sample_rate=frame_sample_rate,
+        duration_factor=duration_factor,
+        force_scaling=force_scaling,
+        crop_pixels=crop_pixels,
+        max_lossy=max_lossy,
+        shared_palette=shared_palette,
+        delta_frames=delta_frames,
+        smooth=smooth,
+        ffmpeg_encoder=ffmpeg_encoder,
+        near_dup_tol=near_dup_tol,
+        target_tolerance=target_tolerance,
+        early_stop_tol=early_stop_tol,
+        stop_event=_stop_event
+    )
+
+    # Raising keeps a partial result out of the cache
+    if _stop_event is not None and _stop_event.is_set():
+        raise CompressionCancelled()
+
+    return output_buffer.getvalue(), orig_size, new_size
+
+# A rerun (Cancel, or any widget change) abandons the previous run's
+# compression, so stop its background thread instead of letting it finish
+if "stop_event" in st.session_state:
+    st.session_state.stop_event.set()
+
 # App title and description
 st.title("GIF Compression Tool")
 st.markdown("Upload a GIF or MP4 file and compress it to your desired size!")
@@ -37,6 +142,24 @@ with st.sidebar:
         help="Maximum number of compression attempts to try"
     )
     
+    target_tolerance = st.slider(
+        "Target Tolerance", 
+        min_value=0.01, 
+        max_value=0.5, 
+        value=0.05, 
+        step=0.01,
+        help="Stop once the result is within this fraction below the target size"
+    )
+    
+    early_stop_tol = st.slider(
+        "Early Stop Tolerance", 
+        min_value=0.0, 
+        max_value=0.1, 
+        value=0.02, 
+        step=0.01,
+        help="Stop once the last three attempts differ in size by less than this fraction (0 = never)"
+    )
+    
     st.markdown("---")
     st.subheader("Advanced Settings")
     
@@ -64,6 +187,33 @@ with st.sidebar:
             value=False,
             help="Enable scaling early in the compression process for better results"
         )
+        
+        max_lossy = st.slider(
+            "Max Lossy (LZW)", 
+            min_value=0, 
+            max_value=200, 
+            value=200, 
+            step=10,
+            help="Highest gifsicle lossy LZW level to try before reducing colors further (requires gifsicle)"
+        )
+        
+        shared_palette = st.checkbox(
+            "Shared Palette", 
+            value=False,
+            help="Use one global color table for all frames instead of one per frame (smaller files)"
+        )
+        
+        smooth = st.checkbox(
+            "Smooth for LZW", 
+            value=False,
+            help="Median-filter frames before compressing to merge stray pixels into longer same-color runs"
+        )
+        
+        ffmpeg_encoder = st.checkbox(
+            "FFmpeg Encoder", 
+            value=False,
+            help="Build palettes and encode with FFmpeg instead of Pillow (used when gifsicle is not installed)"
+        )
     
     with st.expander("Frame Adjustments"):
         frame_sample_rate = st.slider(
@@ -83,6 +233,22 @@ with st.sidebar:
             step=0.1,
             help="Adjust playback speed (1.0 = original, 2.0 = twice as slow)"
         )
+        
+        delta_frames = st.checkbox(
+            "Delta Frames", 
+            value=False,
+            help="Make pixels that did not change since the previous frame transparent (used when gifsicle is not installed)"
+        )
+        
+        near_dup_tol = st.slider(
+            "Near-Duplicate Tolerance", 
+            min_value=0.0, 
+            max_value=0.1, 
+            value=0.0, 
+            step=0.005,
+            format="%.3f",
+            help="Merge a frame into the previous one when at most this fraction of its pixels changed (0 = identical frames only)"
+        )
     
     with st.expander("Crop GIF"):
         st.write("Crop pixels from each edge:")
@@ -119,6 +285,9 @@ with st.sidebar:
             value=False,
             help="Just convert MP4 to GIF without any additional compression"
         )
+        
+        if not _ffmpeg_available():
+            st.caption("FFmpeg not found: MP4 conversion will use the slower OpenCV fallback.")
     
     st.markdown("---")
     st.markdown("### About")
@@ -140,6 +309,14 @@ if uploaded_file is not None:
     # Determine file type
     is_video = uploaded_file.name.lower().endswith('.mp4')
     
+    # Read the upload once and reuse the bytes everywhere below
+    raw_bytes = uploaded_file.getvalue()
+    
+    # Forget the previous result once a different file is uploaded
+    upload_key = (uploaded_file.name, len(raw_bytes))
+    if st.session_state.get("compressed", {}).get("upload") != upload_key:
+        st.session_state.pop("compressed", None)
+    
     # Create a container for the original file (either GIF or video)
     col1, col2 = st.columns(2)
     
@@ -148,14 +325,15 @@ if uploaded_file is not None:
             st.subheader("Original MP4")
             # For MP4 files, use the native video player
             with tempfile.NamedTemporaryFile(suffix=".mp4", delete=False) as temp_mp4:
-                temp_mp4.write(uploaded_file.getvalue())
+                temp_mp4.write(raw_bytes)
                 mp4_path = temp_mp4.name
             
             # Display the video
             st.video(mp4_path)
         else:
             st.subheader("Original GIF")
-            st.image(uploaded_file, use_container_width=True)
+            # Raw GIF bytes are served as-is, keeping the animation intact
+            st.image(raw_bytes, output_format="GIF", use_container_width=True)
         
         # Get and display original file size
         file_size = uploaded_file.size / (1024 * 1024)  # Convert to MB
@@ -170,129 +348,141 @@ if uploaded_file is not None:
     if st.button(button_label):
         with st.spinner("Processing... This may take a moment."):
             try:
-                # Create temporary files for processing
-                with tempfile.NamedTemporaryFile(suffix=".gif", delete=False) as temp_output:
-                    output_path = temp_output.name
-                
                 # Handle video conversion if needed
                 if is_video:
-                    # First convert the MP4 to GIF
-                    with tempfile.NamedTemporaryFile(suffix=".gif", delete=False) as temp_gif:
-                        gif_path = temp_gif.name
-                    
                     # Status message
                     progress_placeholder = st.empty()
                     progress_placeholder.write("Converting MP4 to GIF...")
                     
-                    # Convert the MP4 to GIF
-                    success = convert_mp4_to_gif(
+                    # Convert the MP4 to GIF in memory
+                    _, convert_mp4_to_gif_bytes = _load_compressor()
+                    gif_bytes = convert_mp4_to_gif_bytes(
                         mp4_path, 
-                        gif_path, 
                         fps=video_fps, 
                         scale=video_scale
                     )
                     
-                    if not success:
+                    if gif_bytes is None:
                         st.error("Failed to convert MP4 to GIF. Please check that FFmpeg is installed or try a different file.")
                         # Clean up files
                         os.unlink(mp4_path)
-                        os.unlink(gif_path)
                         st.stop()
                     
-                    # Now we have a GIF to compress
-                    input_path = gif_path
-                    
                     # If user chose to skip compression, we'll just use the converted GIF
                     if skip_compression:
-                        # Just copy the converted GIF to the output path
-                        shutil.copy(input_path, output_path)
-                        orig_size = os.path.getsize(input_path)
+                        compressed_data = gif_bytes
+                        orig_size = len(gif_bytes)
                         new_size = orig_size
                         progress_placeholder.write("MP4 converted to GIF successfully!")
                     else:
                         # Update progress message for compression
                         progress_placeholder.write("MP4 converted to GIF. Now compressing...")
                 else:
-                    # For GIF files, just write to a temp file
-                    with tempfile.NamedTemporaryFile(suffix=".gif", delete=False) as temp_input:
-                        temp_input.write(uploaded_file.getvalue())
-                        input_path = temp_input.name
-                    
-                    # Progress placeholder for compression updates
-                    progress_placeholder = st.empty()
+                    # For GIF files, compress the uploaded bytes directly
+                    gif_bytes = raw_bytes
                 
                 # Run compression if not skipped
                 if not (is_video and skip_compression):
-                    # Define the progress callback function
-                    def progress_callback(attempt, current_size, settings):
-                        progress_placeholder.write(f"Attempt {attempt}: {current_size:.2f}MB (Settings: {settings})")
-                    
-                    # Process the GIF
-                    orig_size, new_size = compress_gif(
-                        input_path,
-                        output_path,
-                        target_size_mb=target_size,
-                        max_attempts=max_attempts,
-                        progress_callback=progress_callback,
-                        min_scale=min_scale,
-                        min_colors=min_colors,
-                        frame_sample_rate=frame_sample_rate,
-                        duration_factor=duration_factor,
-                        force_scaling=force_scaling,
-                        crop_pixels=crop_pixels
+                    # Compress in a background thread so this run can stream
+                    # progress and offer a Cancel button while it works.
+                    # Results are cached on the GIF bytes and settings, so
+                    # repeat clicks skip the compression loop entirely
+                    progress_queue = queue.Queue()
+                    stop_event = threading.Event()
+                    st.session_state.stop_event = stop_event
+
+                    executor = ThreadPoolExecutor(max_workers=1)
+                    future = executor.submit(
+                        _cached_compress,
+                        gif_bytes,
+                        (
+                            target_size,
+                            max_attempts,
+                            min_scale,
+                            min_colors,
+                            frame_sample_rate,
+                            duration_factor,
+                            force_scaling,
+                            crop_pixels,
+                            max_lossy,
+                            shared_palette,
+                            delta_frames,
+                            smooth,
+                            ffmpeg_encoder,
+                            near_dup_tol,
+                            target_tolerance,
+                            early_stop_tol,
+                        ),
+                        progress_queue,
+                        stop_event,
                     )
+                    # Don't wait for the thread if this run is interrupted
+                    executor.shutdown(wait=False)
+
+                    status_placeholder = st.empty()
+                    st.button("Cancel")
+                    start_time = time.time()
+                    latest_attempt = None
+                    while not future.done():
+                        while not progress_queue.empty():
+                            latest_attempt = progress_queue.get()
+                        elapsed = time.time() - start_time
+                        if latest_attempt:
+                            attempt, size_mb, settings_info = latest_attempt
+                            status_placeholder.write(
+                                f"Attempt {attempt}: {size_mb:.2f} MB ({settings_info}) "
+                                f"- {elapsed:.1f}s elapsed, {elapsed / attempt:.1f}s per attempt"
+                            )
+                        else:
+                            status_placeholder.write(f"Compressing... {elapsed:.1f}s elapsed")
+                        time.sleep(0.25)
+                    status_placeholder.empty()
+
+                    compressed_data, orig_size, new_size = future.result()
                 
-                # Read the compressed file
-                with open(output_path, "rb") as f:
-                    compressed_data = f.read()
+                # Record the compression settings used
+                converted_only = is_video and skip_compression
+                settings = []
+                if is_video:
+                    settings.append(f"Converted from MP4 (FPS: {video_fps}, Scale: {video_scale})")
                 
-                # Display the compressed GIF
-                with col2:
-                    result_label = "Converted GIF" if (is_video and skip_compression) else "Compressed GIF"
-                    st.subheader(result_label)
-                    st.image(compressed_data, use_container_width=True)
-                    
-                    # Display stats
-                    new_size_mb = new_size / (1024 * 1024)
-                    compression_ratio = (1 - (new_size / orig_size)) * 100
-                    st.write(f"Final Size: {new_size_mb:.2f} MB")
-                    
-                    # Only show compression ratio if compression was applied
-                    if not (is_video and skip_compression):
-                        st.write(f"Compression: {compression_ratio:.2f}%")
-                    
-                    # Display compression settings used
-                    st.write("**Applied Settings:**")
-                    settings = []
-                    if is_video:
-                        settings.append(f"Converted from MP4 (FPS: {video_fps}, Scale: {video_scale})")
-                    
-                    # Only display compression-related settings if compression was applied
-                    if not (is_video and skip_compression):
-                        if crop_pixels:
-                            settings.append(f"Cropped: {crop_pixels}")
-                        if frame_sample_rate < 1.0:
-                            settings.append(f"Frame sampling: {frame_sample_rate:.1f}")
-                        if duration_factor != 1.0:
-                            settings.append(f"Duration adjustment: {duration_factor:.1f}x")
-                        if min_colors < 256:
-                            settings.append(f"Color reduction: min {min_colors} colors")
-                        if min_scale < 1.0:
-                            settings.append(f"Scale reduction: min {min_scale:.2f}x")
-                        if force_scaling:
-                            settings.append("Scaling applied early")
-                        
-                    if settings:
-                        st.write(", ".join(settings))
+                # Only display compression-related settings if compression was applied
+                if not converted_only:
+                    if crop_pixels:
+                        settings.append(f"Cropped: {crop_pixels}")
+                    if frame_sample_rate < 1.0:
+                        settings.append(f"Frame sampling: {frame_sample_rate:.1f}")
+                    if duration_factor != 1.0:
+                        settings.append(f"Duration adjustment: {duration_factor:.1f}x")
+                    if min_colors < 256:
+                        settings.append(f"Color reduction: min {min_colors} colors")
+                    if min_scale < 1.0:
+                        settings.append(f"Scale reduction: min {min_scale:.2f}x")
+                    if force_scaling:
+                        settings.append("Scaling applied early")
+                    if max_lossy < 200:
+                        settings.append(f"Lossy LZW: max {max_lossy}")
+                    if shared_palette:
+                        settings.append("Shared palette")
+                    if delta_frames:
+                        settings.append("Delta frames")
+                    if smooth:
+                        settings.append("Smoothed for LZW")
+                    if ffmpeg_encoder:
+                        settings.append("FFmpeg encoder")
+                    if near_dup_tol > 0:
+                        settings.append(f"Near-duplicate frames merged: {near_dup_tol:.3f}")
                 
-                # Allow downloading the final file
-                download_label = "Download Converted GIF" if (is_video and skip_compression) else "Download Compressed GIF"
-                st.download_button(
-                    label=download_label,
-                    data=compressed_data,
-                    file_name=f"{'converted' if (is_video and skip_compression) else 'compressed'}_{os.path.splitext(uploaded_file.name)[0]}.gif",
-                    mime="image/gif"
-                )
+                # Keep the result in the session so reruns (such as the one
+                # the download button triggers) show it without recompressing
+                st.session_state.compressed = {
+                    "upload": upload_key,
+                    "data": compressed_data,
+                    "orig_size": orig_size,
+                    "new_size": new_size,
+                    "converted_only": converted_only,
+                    "settings": settings,
+                }
             except Exception as e:
                 st.error(f"Error processing file: {e}")
             
@@ -301,11 +491,39 @@ if uploaded_file is not None:
                 try:
                     if is_video:
                         os.unlink(mp4_path)
-                        if 'gif_path' in locals():
-                            os.unlink(gif_path)
-                    if 'input_path' in locals():
-                        os.unlink(input_path)
-                    if 'output_path' in locals():
-                        os.unlink(output_path)
                 except Exception as e:
-                    pass 
\ No newline at end of file
+                    pass
+
+    # Show the latest result, whether it was produced in this run or an earlier one
+    result = st.session_state.get("compressed")
+    if result:
+        converted_only = result["converted_only"]
+        
+        # Display the compressed GIF
+        with col2:
+            result_label = "Converted GIF" if converted_only else "Compressed GIF"
+            st.subheader(result_label)
+            st.image(result["data"], output_format="GIF", use_container_width=True)
+            
+            # Display stats
+            new_size_mb = result["new_size"] / (1024 * 1024)
+            compression_ratio = (1 - (result["new_size"] / result["orig_size"])) * 100
+            st.write(f"Final Size: {new_size_mb:.2f} MB")
+            
+            # Only show compression ratio if compression was applied
+            if not converted_only:
+                st.write(f"Compression: {compression_ratio:.2f}%")
+            
+            # Display compression settings used
+            st.write("**Applied Settings:**")
+            if result["settings"]:
+                st.write(", ".join(result["settings"]))
+        
+        # Allow downloading the final file
+        download_label = "Download Converted GIF" if converted_only else "Download Compressed GIF"
+        st.download_button(
+            label=download_label,
+            data=result["data"],
+            file_name=f"{'converted' if converted_only else 'compressed'}_{os.path.splitext(uploaded_file.name)[0]}.gif",
+            mime="image/gif"
+        )
@@ -1,11 +1,33 @@
 import argparse
+import contextlib
+import functools
+import io
 import os
+import re
 import shutil
 import subprocess
 import tempfile
 import math
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 
-from PIL import Image, ImageSequence
+import numpy as np
+import PIL
+from PIL import Image, ImageFilter, ImageSequence
+
+# Look gifsicle and ffmpeg up once per process instead of on every call
+_GIFSICLE_PATH = shutil.which("gifsicle")
+_HAS_GIFSICLE = _GIFSICLE_PATH is not None
+_FFMPEG_PATH = shutil.which("ffmpeg")
+_HAS_FFMPEG = _FFMPEG_PATH is not None
+
+# Pillow-SIMD (versioned like "9.0.0.post1") vectorizes Lanczos; stock Pillow
+# downscales faster with bicubic at similar quality
+_RESAMPLE = Image.LANCZOS if ".post" in PIL.__version__ else Image.BICUBIC
+
+# RAM-backed tmpfs for scratch files, where the system has one
+_SHM_DIR = "/dev/shm" if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK) else None
 
 
 def convert_mp4_to_gif(video_path, gif_path, fps=10, scale=1.0):
@@ -21,49 +43,13 @@ def convert_mp4_to_gif(video_path, gif_path, fps=10, scale=1.0):
     Returns:
         bool: True if successful, False otherwise
     """
-    # Try using FFmpeg first (much better quality and efficiency)
+    # Try using FFmpeg first (much better quality and efficiency). Palette
+    # generation and encoding share one decode through a split filter graph.
     try:
-        # Check if FFmpeg is available
-        subprocess.run(
-            ["ffmpeg", "-version"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            check=True,
-        )
-        
-        # Create temp file for the palette (better quality with palette)
-        with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as temp_palette:
-            palette_path = temp_palette.name
-        
-        # Build filter string based on scale
-        if scale != 1.0:
-            filter_scale = f"scale=iw*{scale}:ih*{scale}:flags=lanczos,"
-        else:
-            filter_scale = ""
-            
-        filter_str = f"{filter_scale}fps={fps}"
-        palette_filter = f"{filter_str},palettegen=stats_mode=diff"
-        output_filter = f"{filter_str},paletteuse=dither=bayer:bayer_scale=5:diff_mode=rectangle"
-        
-        # First pass - generate palette
-        subprocess.run([
-            "ffmpeg",
-            "-i", video_path,
-            "-vf", palette_filter,
-            "-y", palette_path
-        ], stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
-        
-        # Second pass - generate GIF with palette
-        subprocess.run([
-            "ffmpeg",
-            "-i", video_path,
-            "-i", palette_path,
-            "-lavfi", output_filter,
+        _run_video_ffmpeg(video_path, [
+            "-filter_complex", _mp4_filter_graph(fps, scale),
             "-y", gif_path
-        ], stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
-        
-        # Clean up
-        os.unlink(palette_path)
+        ], stdout=subprocess.DEVNULL)
         return True
         
     except (subprocess.SubprocessError, FileNotFoundError) as e:
@@ -74,9 +60,111 @@ def convert_mp4_to_gif(video_path, gif_path, fps=10, scale=1.0):
             print(f"PIL conversion also failed: {e}")
             return False
 
+def convert_mp4_to_gif_bytes(video_path, fps=10, scale=1.0):
+    """
+    Convert MP4 video to GIF data in memory.
+
+    Palette generation and encoding share a single decode of the video through
+    a split filter graph, and the GIF is read straight from ffmpeg's stdout.
+    
+    Args:
+        video_path (str): Path to input MP4 file
+        fps (int): Frames per second for the output GIF
+        scale (float): Scale factor for resolution (1.0 = original size)
+        
+    Returns:
+        bytes: The GIF data, or None if conversion failed
+    """
+    try:
+        result = _run_video_ffmpeg(video_path, [
+            "-filter_complex", _mp4_filter_graph(fps, scale),
+            "-f", "gif",
+            "pipe:1"
+        ], stdout=subprocess.PIPE)
+        return result.stdout
+        
+    except (subprocess.SubprocessError, FileNotFoundError) as e:
+        print(f"FFmpeg error: {e}. Falling back to PIL conversion (lower quality).")
+        buffer = io.BytesIO()
+        try:
+            if _convert_mp4_to_gif_with_pil(video_path, buffer, fps, scale):
+                return buffer.getvalue()
+        except Exception as e:
+            print(f"PIL conversion also failed: {e}")
+        return None
+
+def _run_video_ffmpeg(video_path, output_args, stdout):
+    """
+    Run ffmpeg on a video, decoding it on an NVIDIA GPU when possible.
+    
+    Decoded frames are copied back to system memory, since palettegen and
+    paletteuse run on the CPU. If hardware decoding fails (no usable GPU,
+    or an unsupported codec), the same command is retried without it.
+    
+    Args:
+        video_path (str): Path to input video file
+        output_args (list): ffmpeg arguments that follow the input
+        stdout: Where ffmpeg's stdout goes (subprocess.PIPE or DEVNULL)
+        
+    Returns:
+        subprocess.CompletedProcess: The finished ffmpeg run
+    """
+    if not _HAS_FFMPEG:
+        raise FileNotFoundError("ffmpeg not found")
+
+    # Let ffmpeg thread decoding and the palette filter graph across all cores
+    thread_args = [
+        "-threads", "0",
+        "-filter_complex_threads", str(os.cpu_count() or 1),
+    ]
+
+    hwaccel_options = [["-hwaccel", "cuda"], []] if _has_cuda_hwaccel() else [[]]
+    for hwaccel_args in hwaccel_options:
+        try:
+            return subprocess.run(
+                [_FFMPEG_PATH, *thread_args, *hwaccel_args, "-i", video_path, *output_args],
+                stdout=stdout,
+                stderr=subprocess.DEVNULL,
+                check=True,
+            )
+        except subprocess.CalledProcessError:
+            if not hwaccel_args:
+                raise
+
+
+@functools.lru_cache(maxsize=1)
+def _has_cuda_hwaccel():
+    """Check once whether ffmpeg was built with CUDA (NVDEC) decoding."""
+    if not _HAS_FFMPEG:
+        return False
+    try:
+        result = subprocess.run(
+            [_FFMPEG_PATH, "-hide_banner", "-hwaccels"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            check=True,
+        )
+    except (subprocess.SubprocessError, FileNotFoundError):
+        return False
+    return "cuda" in result.stdout.split()
+
+def _mp4_filter_graph(fps, scale):
+    """Build a one-pass ffmpeg filter graph that generates and applies a palette."""
+    if scale != 1.0:
+        filter_scale = f"scale=iw*{scale}:ih*{scale}:flags=lanczos,"
+    else:
+        filter_scale = ""
+
+    return (
+        f"{filter_scale}fps={fps},split[a][b];"
+        "[a]palettegen=stats_mode=diff[p];"
+        "[b][p]paletteuse=dither=bayer:bayer_scale=5:diff_mode=rectangle"
+    )
+
 def _convert_mp4_to_gif_with_pil(video_path, gif_path, fps=10, scale=1.0):
     """
-    Fallback method to convert MP4 to GIF using PIL and temporary images.
+    Fallback method to convert MP4 to GIF using OpenCV and PIL.
     Less efficient and lower quality than FFmpeg method.
     """
     # We need to extract frames first using OpenCV
@@ -86,8 +174,7 @@ def _convert_mp4_to_gif_with_pil(video_path, gif_path, fps=10, scale=1.0):
         print("OpenCV (cv2) is required for PIL-based video conversion.")
         return False
     
-    temp_dir = tempfile.mkdtemp()
-    
+    video = None
     try:
         # Open the video file
         video = cv2.VideoCapture(video_path)
@@ -100,43 +187,44 @@ def _convert_mp4_to_gif_with_pil(video_path, gif_path, fps=10, scale=1.0):
         
         # Calculate which frames to keep based on target fps
         frame_interval = max(1, round(video_fps / fps))
-        frames = []
-        
-        # Extract frames to temporary directory
-        success, frame = video.read()
-        frame_idx = 0
-        
-        while success:
-            if frame_idx % frame_interval == 0:
-                # Resize if needed
-                if scale != 1.0:
-                    height, width = frame.shape[:2]
-                    new_width = int(width * scale)
-                    new_height = int(height * scale)
-                    frame = cv2.resize(frame, (new_width, new_height), interpolation=cv2.INTER_LANCZOS4)
-                
-                # Convert BGR to RGB (OpenCV uses BGR)
-                frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                
-                # Create PIL Image and append to frames list
-                pil_img = Image.fromarray(frame_rgb)
-                frames.append(pil_img)
-                
-            # Read next frame
+
+        def read_frames():
+            # Frames are read lazily while Pillow writes the GIF, and each is
+            # reduced to a paletted image right away, so only 1 byte per pixel
+            # is held per frame instead of the full RGB frame
             success, frame = video.read()
-            frame_idx += 1
+            frame_idx = 0
             
-        # Release video
-        video.release()
-        
-        if not frames:
+            while success:
+                if frame_idx % frame_interval == 0:
+                    # Resize if needed
+                    if scale != 1.0:
+                        height, width = frame.shape[:2]
+                        new_width = int(width * scale)
+                        new_height = int(height * scale)
+                        frame = cv2.resize(frame, (new_width, new_height), interpolation=cv2.INTER_AREA)
+                    
+                    # Convert BGR to RGB (OpenCV uses BGR)
+                    frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                    
+                    yield Image.fromarray(frame_rgb).quantize(
+                        colors=256, method=Image.FASTOCTREE
+                    )
+                    
+                # Read next frame
+                success, frame = video.read()
+                frame_idx += 1
+
+        frames = read_frames()
+        first_frame = next(frames, None)
+        if first_frame is None:
             raise ValueError("No frames extracted from video")
         
         # Save as GIF
-        frames[0].save(
+        first_frame.save(
             gif_path,
             format="GIF",
-            append_images=frames[1:],
+            append_images=frames,
             save_all=True,
             optimize=True,
             duration=int(1000 / fps),  # Duration in ms between frames
@@ -148,10 +236,11 @@ def _convert_mp4_to_gif_with_pil(video_path, gif_path, fps=10, scale=1.0):
     except Exception as e:
         print(f"Error in PIL conversion: {e}")
         return False
-        
+
     finally:
-        # Clean up temporary directory
-        shutil.rmtree(temp_dir, ignore_errors=True)
+        # Release video, whether or not the conversion succeeded
+        if video is not None:
+            video.release()
 
 
 def compress_gif(
@@ -165,14 +254,25 @@ def compress_gif(
     frame_sample_rate=1.0,
     duration_factor=1.0,
     force_scaling=False,
-    crop_pixels=None
+    crop_pixels=None,
+    max_lossy=200,
+    shared_palette=False,
+    delta_frames=False,
+    smooth=False,
+    ffmpeg_encoder=False,
+    near_dup_tol=0.0,
+    target_tolerance=0.05,
+    early_stop_tol=0.02,
+    workers=None,
+    stop_event=None
 ):
     """
     Compress a GIF to target approximately 1MB (or specified size) using adaptive compression.
 
     Args:
-        input_path (str): Path to the input GIF
-        output_path (str): Path to save the compressed GIF
+        input_path (str or file-like): Path to the input GIF, or a binary file object
+        output_path (str or file-like): Path to save the compressed GIF, or a writable
+            binary file object
         target_size_mb (float): Target size in MB
         max_attempts (int): Maximum number of compression attempts
         progress_callback (function, optional): Callback function for progress updates
@@ -182,403 +282,1088 @@ def compress_gif(
         duration_factor (float): Factor to multiply frame duration by (>1 = slower GIF)
         force_scaling (bool): Start with scaling in the first pass to get better compression
         crop_pixels (tuple, optional): Pixels to crop (left, top, right, bottom)
+        max_lossy (int): Highest gifsicle lossy LZW level to try (0-200)
+        shared_palette (bool): Quantize all frames against one global palette
+        delta_frames (bool): Make pixels unchanged since the previous frame transparent
+            (Pillow fallback only; gifsicle's --optimize=3 already does this)
+        smooth (bool): Median-filter frames first so runs of one color compress better
+        ffmpeg_encoder (bool): Encode with FFmpeg's palettegen/paletteuse instead of
+            Pillow (Pillow fallback only)
+        near_dup_tol (float): Merge a frame into the previous one when at most this
+            fraction of its pixels changed (0 = only identical frames)
+        target_tolerance (float): Stop once the result is within this fraction below the target
+        early_stop_tol (float): Stop once the last three attempts differ in size by less
+            than this fraction (0 = never)
+        workers (int, optional): Number of attempts to run in parallel (default: CPU count)
+        stop_event (threading.Event, optional): Once set, stop after the current round
+            of attempts and return the best result so far
 
     Returns:
         tuple: Original and new file sizes in bytes
     """
-    # Get original file size
-    original_size = os.path.getsize(input_path)
     target_size_bytes = int(target_size_mb * 1024 * 1024)
 
-    # If already smaller than target, just copy the file
-    if original_size <= target_size_bytes:
-        shutil.copy(input_path, output_path)
-        return original_size, original_size
+    # In-memory input (e.g. BytesIO) is compared and copied without touching disk
+    input_data = None
+    if hasattr(input_path, "read"):
+        input_data = input_path.read()
+        original_size = len(input_data)
+        if original_size <= target_size_bytes:
+            _write_output(input_data, output_path)
+            return original_size, original_size
+    else:
+        # Get original file size
+        original_size = os.path.getsize(input_path)
+
+        # If already smaller than target, just copy the file
+        if original_size <= target_size_bytes:
+            _copy_output(input_path, output_path)
+            return original_size, original_size
+
+    # Every temp file goes in one directory that is removed as a whole, even
+    # if compression fails part way. When that directory is on tmpfs the
+    # attempts stay there and the chosen one is copied out once; otherwise
+    # they are written next to the output file, so the chosen one can be
+    # renamed into place. In-memory outputs keep them with the other files.
+    # At peak the directory holds the spilled input, a preprocessed copy, a
+    # shared-palette copy and one output per parallel attempt, and the
+    # gentlest attempts come out close to the original size.
+    workers = max(1, min(workers or os.cpu_count() or 1, max_attempts))
+    scratch_dir = _scratch_dir(original_size * (workers + 3))
+    temp_dir = tempfile.TemporaryDirectory(dir=scratch_dir)
+    output_dir = None
+    attempt_dir = temp_dir
+    if not hasattr(output_path, "write") and scratch_dir != _SHM_DIR:
+        output_dir = os.path.dirname(os.path.abspath(output_path))
+        attempt_dir = tempfile.TemporaryDirectory(dir=output_dir)
+    executor = None
+    frames_dir = None
 
-    # Apply preprocessing steps in sequence (cropping, then frame adjustments)
-    processed_input = input_path
-    
-    # Apply cropping if requested
-    if crop_pixels and any(crop_pixels):
-        temp_cropped = tempfile.NamedTemporaryFile(suffix=".gif", delete=False).name
-        _crop_gif(processed_input, temp_cropped, crop_pixels)
-        
-        # Update the input path for next steps
-        if processed_input != input_path:
-            os.unlink(processed_input)  # Clean up any previous temp file
-        processed_input = temp_cropped
-    
-    # Apply frame sampling/duration adjustment if requested
-    if frame_sample_rate < 1.0 or duration_factor != 1.0:
-        temp_sampled = tempfile.NamedTemporaryFile(suffix=".gif", delete=False).name
-        _adjust_frames(processed_input, temp_sampled, frame_sample_rate, duration_factor)
-        
-        # Update the input path for next steps
-        if processed_input != input_path:
-            os.unlink(processed_input)  # Clean up any previous temp file
-        processed_input = temp_sampled
+    try:
+        if input_data is not None:
+            # gifsicle works on paths, so spill it once; the Pillow fallback
+            # decodes it straight from memory
+            if _HAS_GIFSICLE:
+                input_path = os.path.join(temp_dir.name, "input.gif")
+                with open(input_path, "wb") as temp_input:
+                    temp_input.write(input_data)
+            else:
+                input_path = io.BytesIO(input_data)
+
+        # Check if gifsicle is installed
+        use_gifsicle = _HAS_GIFSICLE
+        if not use_gifsicle:
+            print(
+                "Gifsicle not found. Using Pillow for compression (less effective but no external dependencies)."
+            )
 
-    # From here on, use processed_input instead of input_path
-    input_path_to_use = processed_input
+        if ffmpeg_encoder and not use_gifsicle and not _HAS_FFMPEG:
+            ffmpeg_encoder = False
+            print("FFmpeg not found. Encoding with Pillow instead.")
+
+        # Cropping and frame adjustments are slices of the decoded frame array,
+        # and smoothing runs once here rather than on every attempt.
+        # The Pillow fallback compresses that array directly; gifsicle needs it
+        # written back out as a GIF first, unless only cropping, frame sampling
+        # and retiming are asked for, which gifsicle does on the encoded frames.
+        processed_input = input_path
+        decoded = None
+        pixel_edits = smooth or near_dup_tol > 0
+        # Settings that would leave every frame as it is (e.g. a sample rate
+        # that still keeps every frame) don't count as preprocessing
+        needs_preprocessing = (
+            (crop_pixels and any(pixels > 0 for pixels in crop_pixels))
+            or (frame_sample_rate < 1.0 and round(1 / frame_sample_rate) > 1)
+            or abs(duration_factor - 1.0) > 1e-6
+            or pixel_edits
+        )
+        if use_gifsicle and needs_preprocessing and not pixel_edits:
+            gifsicle_input = os.path.join(temp_dir.name, "preprocessed.gif")
+            if _preprocess_with_gifsicle(
+                input_path, gifsicle_input, crop_pixels, frame_sample_rate, duration_factor
+            ):
+                processed_input = gifsicle_input
+                needs_preprocessing = False
+
+        if needs_preprocessing or not use_gifsicle:
+            decoded = _preprocess_frames(
+                _decode_gif(input_path, near_dup_tol),
+                crop_pixels,
+                frame_sample_rate,
+                duration_factor,
+                smooth,
+            )
 
-    # Check if gifsicle is installed
-    use_gifsicle = True
-    try:
+        if needs_preprocessing and use_gifsicle:
+            processed_input = os.path.join(temp_dir.name, "frames.gif")
+            _save_frames(decoded, processed_input)
+            decoded = None
+
+        # Remap every frame onto one shared palette for gifsicle; the Pillow
+        # fallback builds its own shared palette on each attempt instead
+        if shared_palette and use_gifsicle:
+            temp_shared = os.path.join(temp_dir.name, "shared.gif")
+            _share_palette(processed_input, temp_shared)
+            processed_input = temp_shared
+
+        # From here on, use processed_input instead of input_path
+        input_path_to_use = processed_input
+
+        # Search a single compression level q in [0, 1] instead of scanning a
+        # grid of settings. Output size falls as q grows (see
+        # _settings_for_quality), so bisecting q finds the gentlest settings that
+        # reach the target in O(log n) attempts. Each round evaluates one level per
+        # worker, evenly spaced in the remaining interval; with a single worker
+        # this is plain bisection.
+
+        # gifsicle attempts are separate processes and only need threads; Pillow
+        # attempts hold the GIL and need worker processes to use every core.
+        # The Pillow fallback reuses the frames decoded above for every attempt.
+        # Worker processes map one copy of them from a scratch file instead of
+        # each unpickling its own. Workers are not forked, since the Streamlit
+        # app calls this from one of its server threads and forking a threaded
+        # process can deadlock.
+        if use_gifsicle or workers == 1:
+            executor = ThreadPoolExecutor(max_workers=workers)
+            attempt_frames = decoded
+        else:
+            frames, durations, disposals, loop = decoded
+            frames_dir = tempfile.TemporaryDirectory(
+                dir=_scratch_dir(frames.nbytes + original_size * (workers + 3))
+            )
+            frames_path = os.path.join(frames_dir.name, "frames.npy")
+            np.save(frames_path, frames)
+            executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=_worker_context(),
+                initializer=_set_worker_frames,
+                initargs=(frames_path, durations, disposals, loop),
+            )
+            attempt_frames = None
+
+        # Cores not taken by parallel attempts process frames within an attempt
+        frame_threads = max(1, (os.cpu_count() or 1) // workers)
+
+        tolerance_bytes = target_size_bytes * target_tolerance
+        sizes = {}  # (lossy, colors, scale) -> output size of each finished attempt
+
+        too_big_q = 0.0  # Highest level known to miss the target
+        fit_q = None  # Lowest level known to reach the target
+        fit = None  # (size, path) at fit_q
+        smallest = None  # (size, path) of the smallest output so far
+        kept_outputs = set()  # Attempt outputs still on disk
+        recent_sizes = deque(maxlen=3)  # Sizes of the last three attempts
+
+        # Try compression levels until close enough to the target or max attempts hit
+        attempts = 0
+
+        while attempts < max_attempts:
+            # Stop once the best fit is within tolerance of the target
+            if fit and fit[0] >= target_size_bytes - tolerance_bytes:
+                break
+
+            # Stop early if the caller cancelled the compression
+            if stop_event is not None and stop_event.is_set():
+                break
+
+            # Stop once sizes have plateaued; further levels won't change much
+            if (
+                early_stop_tol
+                and len(recent_sizes) == recent_sizes.maxlen
+                and max(recent_sizes) - min(recent_sizes) < early_stop_tol * min(recent_sizes)
+            ):
+                print("Sizes have converged, stopping early.")
+                break
+
+            count = min(workers, max_attempts - attempts)
+            if attempts == 0:
+                # Start with the original quality, spreading any extra
+                # workers up to the most aggressive settings
+                levels = [i / max(1, count - 1) for i in range(count)]
+            else:
+                upper = fit_q if fit_q is not None else 1.0
+                levels = [
+                    too_big_q + (upper - too_big_q) * (i + 1) / (count + 1)
+                    for i in range(count)
+                ]
+                # Once both ends of the interval are measured, aim one level
+                # at the predicted crossing instead of the plain midpoint
+                low_size, high_size = (
+                    sizes.get(
+                        _settings_for_quality(
+                            end, min_colors, min_scale, max_lossy, force_scaling
+                        )
+                    )
+                    for end in (too_big_q, upper)
+                )
+                predicted_q = _predict_level(
+                    too_big_q, upper, low_size, high_size, target_size_bytes
+                )
+                if predicted_q is not None:
+                    nearest = min(
+                        range(count), key=lambda i: abs(levels[i] - predicted_q)
+                    )
+                    levels[nearest] = predicted_q
+
+            batch = []
+            for q in levels:
+                settings = _settings_for_quality(
+                    q, min_colors, min_scale, max_lossy, force_scaling
+                )
+                if settings in sizes:
+                    # Already measured, so narrow the interval without
+                    # rerunning it. Settings only change with q, so a cached
+                    # fit is the output already kept at fit_q.
+                    if sizes[settings] <= target_size_bytes:
+                        fit_q = q if fit_q is None else min(fit_q, q)
+                    else:
+                        too_big_q = max(too_big_q, q)
+                elif settings not in [queued for _, queued in batch]:
+                    batch.append((q, settings))
+
+            if not batch:
+                # Every level reused a measured size; keep narrowing until
+                # the interval is too small to hold any other settings
+                upper = fit_q if fit_q is not None else 1.0
+                if upper - too_big_q < 1e-3:
+                    break
+                continue
+
+            # Every attempt writes its own temp file
+            outputs = [
+                os.path.join(attempt_dir.name, f"attempt{attempts + i + 1}.gif")
+                for i in range(len(batch))
+            ]
+            kept_outputs.update(outputs)
+            futures = {
+                executor.submit(
+                    _compress_attempt,
+                    input_path_to_use if use_gifsicle else None,
+                    temp_output,
+                    lossy,
+                    colors,
+                    scale,
+                    use_gifsicle,
+                    shared_palette,
+                    delta_frames,
+                    attempt_frames,
+                    ffmpeg_encoder,
+                    frame_threads,
+                ): (q, lossy, colors, scale, temp_output)
+                for (q, (lossy, colors, scale)), temp_output in zip(batch, outputs)
+            }
+
+            # Report attempts as they finish rather than in submission order
+            for future in as_completed(futures):
+                q, lossy, colors, scale, temp_output = futures[future]
+                current_size = future.result()
+                sizes[(lossy, colors, scale)] = current_size
+                attempts += 1
+                recent_sizes.append(current_size)
+
+                # Print progress
+                settings_info = f"Lossy: {lossy}, Colors: {colors}, Scale: {scale}"
+                current_size_mb = current_size/1024/1024
+                print(f"Attempt {attempts}: {current_size_mb:.2f}MB ({settings_info})")
+                
+                # Call progress callback if provided
+                if progress_callback:
+                    progress_callback(attempts, current_size_mb, settings_info)
+
+                # Narrow the interval around the target
+                if current_size <= target_size_bytes:
+                    if fit_q is None or q < fit_q:
+                        fit_q = q
+                        fit = (current_size, temp_output)
+                else:
+                    too_big_q = max(too_big_q, q)
+
+                if smallest is None or current_size < smallest[0]:
+                    smallest = (current_size, temp_output)
+
+            # Only keep the outputs that can still be returned
+            live_outputs = {result[1] for result in (fit, smallest) if result}
+            for stale_output in kept_outputs - live_outputs:
+                os.unlink(stale_output)
+            kept_outputs = live_outputs
+
+        # If no level reached the target, use the smallest output
+        chosen = fit or smallest
+        if chosen is None and hasattr(input_path_to_use, "read"):
+            # Nothing finished (e.g. cancelled right away); return the input
+            _write_output(input_path_to_use.getvalue(), output_path)
+            return original_size, original_size
+        final_output = chosen[1] if chosen else input_path_to_use
+        new_size = os.path.getsize(final_output)
+        if chosen and output_dir is not None:
+            _move_output(final_output, output_path)
+        else:
+            _copy_output(final_output, output_path)
+
+    finally:
+        # Drop queued attempts and clean up temp files, even on errors
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        if frames_dir is not None:
+            frames_dir.cleanup()
+        attempt_dir.cleanup()
+        temp_dir.cleanup()
+
+    return original_size, new_size
+
+
+def _settings_for_quality(q, min_colors, min_scale, max_lossy, force_scaling):
+    """
+    Map a compression level to concrete (lossy, colors, scale) settings.
+
+    q=0 keeps the original quality and q=1 is the most aggressive allowed
+    setting. Knobs are degraded in stages: lossy LZW first, then colors, then
+    scale (or scale alongside the others when force_scaling is set). Every
+    knob only gets more aggressive as q grows, so output size falls with q.
+
+    Args:
+        q (float): Compression level (0.0-1.0)
+        min_colors (int): Minimum number of colors (2-256)
+        min_scale (float): Minimum scale factor (0.1-1.0)
+        max_lossy (int): Highest gifsicle lossy level (0-200)
+        force_scaling (bool): Scale from the start instead of as a last resort
+
+    Returns:
+        tuple: (lossy, colors, scale)
+    """
+    def stage(index, count):
+        return min(1.0, max(0.0, q * count - index))
+
+    if force_scaling:
+        lossy_t, colors_t, scale_t = stage(0, 2), stage(1, 2), q
+    else:
+        lossy_t, colors_t, scale_t = stage(0, 3), stage(1, 3), stage(2, 3)
+
+    min_colors = min(max(min_colors, 2), 256)
+    lossy = round(max_lossy * lossy_t)
+    # Colors shrink geometrically, since each halving costs about the same
+    colors = round(256 * (min_colors / 256) ** colors_t)
+    scale = round(1.0 - (1.0 - min_scale) * scale_t, 2)
+    return lossy, colors, scale
+
+
+def _predict_level(low_q, high_q, low_size, high_size, target_size):
+    """
+    Predict the compression level whose output lands on the target size.
+
+    Output size falls roughly exponentially with the level, so log(size) is
+    interpolated linearly between the two measured ends of the interval.
+    The prediction is kept away from the ends so the interval always shrinks
+    by a useful amount, even when the model is off.
+
+    Args:
+        low_q (float): Level known to miss the target
+        high_q (float): Level known to reach the target (or the top level)
+        low_size (int): Output size at low_q, or None if not measured
+        high_size (int): Output size at high_q, or None if not measured
+        target_size (int): Target size in bytes
+
+    Returns:
+        float: Predicted level, or None to fall back to bisection
+    """
+    if not low_size or not high_size or low_size <= high_size:
+        return None
+
+    t = math.log(low_size / target_size) / math.log(low_size / high_size)
+    t = min(0.9, max(0.1, t))
+    return low_q + (high_q - low_q) * t
+
+
+def _compress_attempt(
+    input_path,
+    output_path,
+    lossy,
+    colors,
+    scale,
+    use_gifsicle,
+    shared_palette=False,
+    delta_frames=False,
+    decoded=None,
+    ffmpeg_encoder=False,
+    frame_threads=1,
+):
+    """
+    Run a single compression attempt.
+
+    Pillow attempts compress `decoded` (see _decode_gif), or the frames handed
+    to this worker process by _set_worker_frames when it is None.
+
+    Returns:
+        int: Size of the compressed output in bytes
+    """
+    if use_gifsicle:
+        lossy_param = []
+        if lossy > 0:
+            lossy_param = ["--lossy={}".format(lossy)]
+
+        scale_param = []
+        if scale < 1.0:
+            scale_param = ["--scale={}".format(scale)]
+
+        # gifsicle can't write several settings from one parse of the input
+        # (--batch only rewrites files in place), so each attempt is its own
+        # process and compress_gif runs them in parallel instead
+        cmd = [
+            _GIFSICLE_PATH,
+            "--optimize=3",
+            *lossy_param,
+            *scale_param,
+            "--colors={}".format(colors),
+            "-i",
+            input_path,
+            "-o",
+            output_path,
+        ]
+        # A failed write (e.g. a full disk) leaves a truncated file, so never
+        # report its size
         subprocess.run(
-            ["gifsicle", "--version"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            check=True,
+            cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True
         )
-    except (subprocess.SubprocessError, FileNotFoundError):
-        use_gifsicle = False
-        print(
-            "Gifsicle not found. Using Pillow for compression (less effective but no external dependencies)."
+    else:
+        _compress_frames(
+            decoded if decoded is not None else _worker_frames,
+            output_path,
+            colors=colors,
+            lossy_equivalent=lossy,
+            scale=scale,
+            shared_palette=shared_palette,
+            delta_frames=delta_frames,
+            ffmpeg_encoder=ffmpeg_encoder,
+            frame_threads=frame_threads,
         )
 
-    # Create temporary file for intermediate results
-    temp_output = tempfile.NamedTemporaryFile(suffix=".gif", delete=False).name
+    return os.path.getsize(output_path)
 
-    # Progressive compression settings with constraints
-    lossy_values = [0, 30, 60, 90, 120, 150, 200]
-    color_values = [c for c in [256, 192, 128, 96, 64, 32] if c >= min_colors]
-    scale_values = [s for s in [1.0, 0.9, 0.8, 0.7, 0.6, 0.5, 0.4] if s >= min_scale]
-    
-    # Make sure we have at least one value for each parameter
-    if not color_values:
-        color_values = [min_colors]
-    if not scale_values:
-        scale_values = [min_scale]
 
-    best_size = original_size
-    best_output = None
+# Decoded source frames of the GIF being compressed, per worker process
+_worker_frames = None
 
-    # Try different compression settings until target size is reached or max attempts hit
-    attempts = 0
 
-    # If force_scaling is True, we'll include scaling in the first pass
-    first_pass_scales = [1.0] if not force_scaling else scale_values
-    
-    # First pass: try lossy compression, color reduction, and optionally scaling
-    for scale in first_pass_scales:
-        for lossy in lossy_values:
-            for colors in color_values:
-                # Skip if we're not making progress or out of attempts
-                if attempts >= max_attempts:
-                    break
+def _worker_context():
+    """Pick a start method for attempt workers that does not fork the caller."""
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context("spawn")
 
-                attempts += 1
 
-                # Compress with current settings
-                if use_gifsicle:
-                    lossy_param = []
-                    if lossy > 0:
-                        lossy_param = ["--lossy={}".format(lossy)]
-
-                    scale_param = []
-                    if scale < 1.0:
-                        scale_param = ["--scale={}".format(scale)]
-
-                    cmd = [
-                        "gifsicle",
-                        "--optimize=3",
-                        *lossy_param,
-                        *scale_param,
-                        "--colors={}".format(colors),
-                        "-i",
-                        input_path_to_use,
-                        "-o",
-                        temp_output,
-                    ]
-                    subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                else:
-                    _compress_with_pillow(
-                        input_path_to_use,
-                        temp_output,
-                        colors=colors,
-                        lossy_equivalent=lossy,
-                        scale=scale,
-                    )
+def _set_worker_frames(frames_path, durations, disposals, loop):
+    """Process pool initializer: map the decoded source frames into this worker."""
+    global _worker_frames
+    frames = np.load(frames_path, mmap_mode="r")
+    _worker_frames = (frames, durations, disposals, loop)
+
+
+def _write_output(data, output_path):
+    """Write GIF bytes to an output path or a writable binary file object."""
+    if hasattr(output_path, "write"):
+        output_path.write(data)
+    else:
+        with open(output_path, "wb") as f:
+            f.write(data)
 
-                # Check if we reached target size
-                current_size = os.path.getsize(temp_output)
-
-                # If this is the best size so far, save it
-                if current_size < best_size:
-                    best_size = current_size
-                    if best_output:
-                        os.unlink(best_output)
-                    best_output = tempfile.NamedTemporaryFile(
-                        suffix=".gif", delete=False
-                    ).name
-                    shutil.copy(temp_output, best_output)
-
-                    # Print progress
-                    settings_info = f"Lossy: {lossy}, Colors: {colors}, Scale: {scale}"
-                    best_size_mb = best_size/1024/1024
-                    print(f"Attempt {attempts}: {best_size_mb:.2f}MB ({settings_info})")
-                    
-                    # Call progress callback if provided
-                    if progress_callback:
-                        progress_callback(attempts, best_size_mb, settings_info)
-
-                    # If we're at or below target size, we're done
-                    if best_size <= target_size_bytes:
-                        break
-
-    # Second pass: if still above target size, try scaling down (if not already included in first pass)
-    if best_size > target_size_bytes and not force_scaling:
-        for scale in scale_values[1:]:  # Skip scale 1.0
-            for lossy in [60, 120, 200]:  # Use more aggressive lossy values
-                for colors in color_values:  # Use same color values as specified
-                    # Skip if we're not making progress or out of attempts
-                    if attempts >= max_attempts:
-                        break
-
-                    attempts += 1
-
-                    # Compress with current settings
-                    if use_gifsicle:
-                        cmd = [
-                            "gifsicle",
-                            "--optimize=3",
-                            "--lossy={}".format(lossy),
-                            "--colors={}".format(colors),
-                            "--scale={}".format(scale),
-                            "-i",
-                            input_path_to_use,
-                            "-o",
-                            temp_output,
-                        ]
-                        subprocess.run(
-                            cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE
-                        )
-                    else:
-                        _compress_with_pillow(
-                            input_path_to_use,
-                            temp_output,
-                            colors=colors,
-                            lossy_equivalent=lossy,
-                            scale=scale,
-                        )
 
-                    # Check size
-                    current_size = os.path.getsize(temp_output)
-
-                    # If this is the best size so far, save it
-                    if current_size < best_size:
-                        best_size = current_size
-                        if best_output:
-                            os.unlink(best_output)
-                        best_output = tempfile.NamedTemporaryFile(
-                            suffix=".gif", delete=False
-                        ).name
-                        shutil.copy(temp_output, best_output)
-
-                        # Print progress
-                        settings_info = f"Lossy: {lossy}, Colors: {colors}, Scale: {scale}"
-                        best_size_mb = best_size/1024/1024
-                        print(f"Attempt {attempts}: {best_size_mb:.2f}MB ({settings_info})")
-                        
-                        # Call progress callback if provided
-                        if progress_callback:
-                            progress_callback(attempts, best_size_mb, settings_info)
-
-                        # If we're at or below target size, we're done
-                        if best_size <= target_size_bytes:
-                            break
-
-    # Clean up and return results
-    if best_output:
-        shutil.copy(best_output, output_path)
-        os.unlink(best_output)
+def _copy_output(source_path, output_path):
+    """Copy a GIF file to an output path or a writable binary file object."""
+    if hasattr(output_path, "write"):
+        with open(source_path, "rb") as f:
+            shutil.copyfileobj(f, output_path)
     else:
-        # If no successful compression, just use the last attempt
-        shutil.copy(temp_output, output_path)
+        shutil.copy(source_path, output_path)
+
 
-    os.unlink(temp_output)
+def _scratch_dir(needed_bytes):
+    """Pick /dev/shm for temp files when it has room for them, else the system temp dir."""
+    if _SHM_DIR:
+        stats = os.statvfs(_SHM_DIR)
+        if stats.f_bavail * stats.f_frsize >= needed_bytes:
+            return _SHM_DIR
+    return tempfile.gettempdir()
+
+
+def _move_output(source_path, output_path):
+    """Move a temp GIF to the output path, renaming it when on the same filesystem."""
+    try:
+        os.replace(source_path, output_path)
+    except OSError:
+        shutil.move(source_path, output_path)
+
+
+def _preprocess_frames(
+    decoded, crop_pixels=None, sample_rate=1.0, duration_factor=1.0, smooth=False
+):
+    """
+    Crop, frame-sample, retime and optionally smooth decoded frames.
+    
+    Cropping and sampling slice the frame array, so no pixels are copied.
+    Smoothing applies a 3x3 median filter, which removes isolated pixels
+    and lengthens runs of one color for LZW to match (the idea behind
+    gifsicle's pixel merging).
     
-    # Clean up any temp files
-    if processed_input != input_path:
-        os.unlink(processed_input)
+    Args:
+        decoded (tuple): Output of _decode_gif
+        crop_pixels (tuple, optional): Pixels to crop (left, top, right, bottom)
+        sample_rate (float): Fraction of frames to keep (1.0 = all, 0.5 = every other frame)
+        duration_factor (float): Factor to multiply frame duration by (>1 = slower GIF)
+        smooth (bool): Median-filter every frame
+        
+    Returns:
+        tuple: The adjusted (frames, durations, disposals, loop)
+    """
+    frames, durations, disposals, loop = decoded
 
-    new_size = os.path.getsize(output_path)
-    return original_size, new_size
+    if crop_pixels and any(crop_pixels):
+        left, top, right, bottom = crop_pixels
+        height, width = frames.shape[1:3]
 
+        # Ensure we don't have negative dimensions
+        if width - left - right > 0 and height - top - bottom > 0:
+            frames = frames[:, top:height - bottom, left:width - right]
+
+    # Keep every step-th frame, e.g. 0.5 keeps every other frame
+    step = max(1, round(1 / sample_rate)) if sample_rate < 1.0 else 1
+    frames = frames[::step]
+    durations = (durations[::step] * duration_factor).astype(np.int32)
+    disposals = disposals[::step]
+
+    if smooth:
+        frames = np.stack([
+            np.asarray(Image.fromarray(frame, "RGBA").filter(ImageFilter.MedianFilter(3)))
+            for frame in frames
+        ])
 
-def _crop_gif(input_path, output_path, crop_pixels):
+    return frames, durations, disposals, loop
+
+
+def _preprocess_with_gifsicle(
+    input_path, output_path, crop_pixels=None, sample_rate=1.0, duration_factor=1.0
+):
     """
-    Crop a GIF by removing specified pixels from each edge.
+    Crop, frame-sample and retime a GIF with gifsicle, without decoding it in Python.
+    
+    gifsicle sets a single delay for every frame, so retiming is only done
+    here when the kept frames share one delay.
     
     Args:
         input_path (str): Path to input GIF
-        output_path (str): Path to save the cropped GIF
-        crop_pixels (tuple): Pixels to crop (left, top, right, bottom)
-    """
-    with Image.open(input_path) as img:
-        frames = []
-        durations = []
-        disposals = []
-        
-        # Get dimensions of the original image
-        width, height = img.size
+        output_path (str): Path to save the adjusted GIF
+        crop_pixels (tuple, optional): Pixels to crop (left, top, right, bottom)
+        sample_rate (float): Fraction of frames to keep (1.0 = all, 0.5 = every other frame)
+        duration_factor (float): Factor to multiply frame duration by (>1 = slower GIF)
         
-        # Calculate new dimensions
+    Returns:
+        bool: True if written, False if the frames have mixed delays and
+            need retiming in Python instead
+    """
+    info = subprocess.run(
+        [_GIFSICLE_PATH, "--info", input_path],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+        check=True,
+    ).stdout
+
+    # Delays in centiseconds, from lines like "disposal asis delay 0.10s"
+    delays = []
+    for image_info in info.split("+ image #")[1:]:
+        delay = re.search(r"delay ([\d.]+)s", image_info)
+        delays.append(round(float(delay.group(1)) * 100) if delay else 0)
+
+    # Keep every step-th frame, e.g. 0.5 keeps every other frame
+    step = max(1, round(1 / sample_rate)) if sample_rate < 1.0 else 1
+    kept_frames = range(0, len(delays), step)
+
+    cmd = [_GIFSICLE_PATH]
+
+    if crop_pixels and any(crop_pixels):
         left, top, right, bottom = crop_pixels
+        with Image.open(input_path) as img:
+            width, height = img.size
         new_width = width - left - right
         new_height = height - top - bottom
-        
+
         # Ensure we don't have negative dimensions
-        if new_width <= 0 or new_height <= 0:
-            shutil.copy(input_path, output_path)
-            return
-        
-        # Process each frame
-        for frame in ImageSequence.Iterator(img):
-            # Convert to RGBA to preserve transparency
-            converted = frame.convert("RGBA")
-            
-            # Crop the frame
-            cropped = converted.crop((left, top, width - right, height - bottom))
-            
-            # Save frame info
-            frames.append(cropped)
-            durations.append(frame.info.get("duration", 100))
-            disposals.append(
-                frame.disposal_method if hasattr(frame, "disposal_method") else 2
-            )
-        
-        # Save the cropped GIF
-        if frames:
-            frames[0].save(
-                output_path,
-                format="GIF",
-                append_images=frames[1:],
-                save_all=True,
-                optimize=False,  # Don't optimize yet
-                duration=durations,
-                disposal=disposals,
-                loop=img.info.get("loop", 0),
-            )
-        else:
-            # If no frames (shouldn't happen), just copy the original
-            shutil.copy(input_path, output_path)
+        if new_width > 0 and new_height > 0:
+            cmd += ["--crop", f"{left},{top}+{new_width}x{new_height}"]
+
+    if abs(duration_factor - 1.0) > 1e-6:
+        kept_delays = {delays[i] for i in kept_frames}
+        if len(kept_delays) > 1:
+            return False
+        cmd += ["--delay", str(int(kept_delays.pop() * duration_factor))]
+    if step > 1:
+        # Optimized frames only hold the pixels that changed since the
+        # previous frame, so rebuild full frames before dropping any
+        cmd.append("--unoptimize")
+
+    cmd.append(input_path)
+    if step > 1:
+        cmd += [f"#{i}" for i in kept_frames]
+    cmd += ["-o", output_path]
+
+    subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+    return True
+
+
+def _save_frames(decoded, output_path):
+    """Write decoded frames back out as an unoptimized GIF."""
+    frames, durations, disposals, loop = decoded
+    images = [Image.fromarray(frame, "RGBA") for frame in frames]
+    images[0].save(
+        output_path,
+        format="GIF",
+        append_images=images[1:],
+        save_all=True,
+        optimize=False,  # Don't optimize yet as we'll do that later
+        duration=durations.tolist(),
+        disposal=disposals.tolist(),
+        loop=loop,
+    )
 
 
-def _adjust_frames(input_path, output_path, sample_rate=1.0, duration_factor=1.0):
+def _decode_gif(input_path, near_dup_tol=0.0):
     """
-    Adjust the number of frames and/or frame duration in a GIF.
+    Decode every frame of a GIF once, for reuse across compression attempts.
+    
+    Runs of identical (or, with near_dup_tol, nearly identical) consecutive
+    frames are merged into their first frame, which lasts for their
+    combined duration.
     
     Args:
         input_path (str): Path to input GIF
-        output_path (str): Path to save the modified GIF
-        sample_rate (float): Fraction of frames to keep (1.0 = all, 0.5 = every other frame)
-        duration_factor (float): Factor to multiply frame duration by (>1 = slower GIF)
+        near_dup_tol (float): Fraction of pixels that may differ from the
+            previous frame for a frame to still count as a duplicate
+        
+    Returns:
+        tuple: (frames, durations, disposals, loop), where frames is a uint8
+            RGBA array of shape (n_frames, height, width, 4) and durations
+            and disposals are per-frame int32 and int8 arrays
     """
     with Image.open(input_path) as img:
-        frames = []
-        durations = []
-        disposals = []
+        # Fill preallocated arrays instead of stacking per-frame ones
+        n_frames = getattr(img, "n_frames", 1)
+        width, height = img.size
+        frames = np.empty((n_frames, height, width, 4), dtype=np.uint8)
+        durations = np.empty(n_frames, dtype=np.int32)
+        disposals = np.empty(n_frames, dtype=np.int8)
+        count = 0
         
-        # Get all frames
-        for i, frame in enumerate(ImageSequence.Iterator(img)):
-            # Apply frame sampling
-            if sample_rate < 1.0:
-                # Skip frames based on sample rate
-                if i % int(1/sample_rate) != 0:
-                    continue
-            
-            # Convert to RGBA to preserve transparency
-            converted = frame.convert("RGBA")
-            
-            # Save frame info
-            frames.append(converted)
-            
-            # Adjust duration if needed
-            orig_duration = frame.info.get("duration", 100)
-            adjusted_duration = int(orig_duration * duration_factor)
-            durations.append(adjusted_duration)
-            
-            # Keep disposal mode if available
-            disposals.append(
+        for frame in ImageSequence.Iterator(img):
+            # Convert to RGBA first for better quality
+            pixels = np.asarray(frame.convert("RGBA"))
+            duration = frame.info.get("duration", 100)
+
+            # Drop a frame that duplicates the previous one and show that
+            # one for longer instead, so attempts don't process it again
+            if count and _is_duplicate_frame(frames[count - 1], pixels, near_dup_tol):
+                durations[count - 1] += duration
+                continue
+
+            frames[count] = pixels
+            durations[count] = duration
+            disposals[count] = (
                 frame.disposal_method if hasattr(frame, "disposal_method") else 2
             )
+            count += 1
         
-        # Save the adjusted GIF
-        if frames:
-            frames[0].save(
-                output_path,
-                format="GIF",
-                append_images=frames[1:],
-                save_all=True,
-                optimize=False,  # Don't optimize yet as we'll do that later
-                duration=durations,
-                disposal=disposals,
-                loop=img.info.get("loop", 0),
-            )
-        else:
-            # If no frames (shouldn't happen), just copy the original
-            shutil.copy(input_path, output_path)
+        return (
+            frames[:count],
+            durations[:count],
+            disposals[:count],
+            img.info.get("loop", 0),
+        )
 
 
-def _compress_with_pillow(
-    input_path, output_path, colors=256, lossy_equivalent=0, scale=1.0
+def _is_duplicate_frame(previous, current, near_dup_tol=0.0):
+    """Check whether a decoded frame (nearly) repeats the previous one."""
+    if previous.shape != current.shape:
+        return False
+    # A straight comparison stops at the first difference
+    if not near_dup_tol:
+        return np.array_equal(previous, current)
+    changed = np.count_nonzero((previous != current).any(axis=2))
+    return changed <= near_dup_tol * current.shape[0] * current.shape[1]
+
+
+def _compress_frames(
+    decoded,
+    output_path,
+    colors=256,
+    lossy_equivalent=0,
+    scale=1.0,
+    shared_palette=False,
+    delta_frames=False,
+    ffmpeg_encoder=False,
+    frame_threads=1,
 ):
-    """Fallback compression method using Pillow with approximate lossy effect"""
-    with Image.open(input_path) as img:
-        frames = []
-        durations = []
-        disposals = []
+    """
+    Compress already decoded frames with Pillow, approximating lossy compression.
+    
+    Frames are resized, blurred and quantized independently of each other, so
+    these steps run on a thread pool (Pillow releases the GIL while it works);
+    only the final GIF encode is serial.
+    
+    Args:
+        decoded (tuple): Output of _decode_gif
+        output_path (str): Path to save the compressed GIF
+        colors (int): Number of colors per frame, or in the shared palette
+        lossy_equivalent (int): gifsicle-style lossy level to approximate (0-200)
+        scale (float): Scale factor for resolution
+        shared_palette (bool): Quantize all frames against one global palette
+        delta_frames (bool): Make pixels unchanged since the previous frame transparent
+        ffmpeg_encoder (bool): Quantize and encode with FFmpeg instead, when the
+            frames have no transparency
+        frame_threads (int): Number of threads to process frames with
+    """
+    source_frames, durations, disposals, loop = decoded
+
+    # Determine dithering based on lossy_equivalent
+    # Higher lossy = less dithering
+    dither = Image.FLOYDSTEINBERG
+    if lossy_equivalent > 100:
+        dither = Image.NONE
+
+    # Shrinking by a whole factor (e.g. scale 0.5) with blurring on can use a
+    # single box reduction: averaging each block already low-pass filters,
+    # and it is several times faster than resampling followed by a blur
+    reduce_factor = round(1 / scale)
+    box_reduce = (
+        lossy_equivalent > 30
+        and reduce_factor > 1
+        and abs(scale * reduce_factor - 1) < 1e-6
+    )
 
-        # Determine dithering based on lossy_equivalent
-        # Higher lossy = less dithering
-        dither = Image.FLOYDSTEINBERG
-        if lossy_equivalent > 100:
-            dither = Image.NONE
+    # One box pass with the same spread as the Gaussian blur this replaced,
+    # built once for all frames
+    blur = None
+    if lossy_equivalent > 30:
+        sigma = min(lossy_equivalent / 200, 0.8)
+        blur = ImageFilter.BoxBlur(math.sqrt(3 * sigma * sigma + 0.25) - 0.5)
 
-        # Process each frame
-        for i, frame in enumerate(ImageSequence.Iterator(img)):
-            # Convert to RGBA first for better quality
-            converted = frame.convert("RGBA")
+    def prepare(frame):
+        # Wraps the decoded array without copying, so frames that are
+        # neither resized nor blurred reach the quantizer with no conversion
+        converted = Image.fromarray(frame, "RGBA")
+
+        if box_reduce:
+            return converted.reduce(reduce_factor)
 
-            # Resize if needed
-            if scale != 1.0:
-                new_width = int(converted.width * scale)
-                new_height = int(converted.height * scale)
-                converted = converted.resize((new_width, new_height), Image.LANCZOS)
+        # Resize if needed
+        if scale != 1.0:
+            new_width = int(converted.width * scale)
+            new_height = int(converted.height * scale)
+            converted = converted.resize((new_width, new_height), _RESAMPLE)
+
+        # Apply lossy-like effect by slightly blurring for higher lossy values.
+        # The alpha channel is kept as-is so transparent edges stay hard.
+        if blur is not None:
+            alpha = converted.getchannel("A")
+            converted = converted.filter(blur)
+            converted.putalpha(alpha)
+
+        return converted
+
+    frames = _map_frames(prepare, source_frames, frame_threads)
+
+    # FFmpeg builds its own palette and dithers, replacing everything below
+    if ffmpeg_encoder and not _has_transparency(frames):
+        if _encode_with_ffmpeg(
+            frames, output_path, colors, durations, loop, dither != Image.NONE
+        ):
+            return
 
-            # Apply lossy-like effect by slightly blurring for higher lossy values
-            if lossy_equivalent > 30:
-                from PIL import ImageFilter
+    # Quantize to reduce colors, either against one palette for all
+    # frames (written once as the global color table) or per frame.
+    # Delta frames need the shared palette to compare pixels by index.
+    palette = None
+    transparency = None
+    if (shared_palette or delta_frames) and not _has_transparency(frames):
+        rgb_frames = [frame.convert("RGB") for frame in frames]
+        if delta_frames:
+            # Leave room for the transparent index
+            colors = min(colors, 256) - 1
+        master = _build_shared_palette(rgb_frames, colors)
+        # Pillow's palette mapping caches the nearest index per color, which
+        # is faster than building a lookup structure once in NumPy
+        frames = _map_frames(
+            lambda frame: frame.quantize(palette=master, dither=Image.NONE),
+            rgb_frames,
+            frame_threads,
+        )
+        palette = master.getpalette()
+        if delta_frames:
+            frames, palette = _delta_encode(frames, palette)
+            transparency = 0
+            # Keep each frame on screen so the transparent pixels show it
+            disposals = np.ones(len(frames), dtype=np.int8)
+    else:
+        frames = _map_frames(
+            lambda frame: _quantize_frame(frame, colors, dither), frames, frame_threads
+        )
 
-                blur_radius = min(lossy_equivalent / 200, 0.8)
-                converted = converted.filter(
-                    ImageFilter.GaussianBlur(radius=blur_radius)
-                )
+    # Save the optimized GIF. Pillow already skips palette optimization
+    # when it cannot shrink the palette, and optimize=True is also what makes
+    # it fill unchanged pixels with a transparent index, so keep it on.
+    # Only pass palette/transparency when set: a transparency key, even None,
+    # stops Pillow from reserving a spare transparent index of its own
+    save_kwargs = {
+        "format": "GIF",
+        "append_images": frames[1:],
+        "save_all": True,
+        "optimize": True,
+        "duration": durations.tolist(),
+        "disposal": disposals.tolist(),
+        "loop": loop,
+    }
+    if palette is not None:
+        save_kwargs["palette"] = palette
+    if transparency is not None:
+        save_kwargs["transparency"] = transparency
+    frames[0].save(output_path, **save_kwargs)
+
+
+def _map_frames(func, frames, threads=1):
+    """Apply func to every frame in order, on a thread pool when threads > 1."""
+    if threads <= 1:
+        return [func(frame) for frame in frames]
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        return list(executor.map(func, frames))
+
+
+def _encode_with_ffmpeg(frames, output_path, colors, durations, loop=0, dither=True):
+    """
+    Encode frames to a GIF with FFmpeg's palettegen and paletteuse filters.
+    
+    The frames are piped to FFmpeg as raw RGB video. FFmpeg needs a constant
+    frame rate, so per-frame durations are replaced by their average.
+    
+    Args:
+        frames (list): RGB or RGBA PIL images of equal size
+        output_path (str): Path to save the GIF
+        colors (int): Number of colors in the palette
+        durations (numpy.ndarray): Frame durations in milliseconds
+        loop (int): GIF loop count (0 = forever)
+        dither (bool): Use Bayer dithering when mapping to the palette
+        
+    Returns:
+        bool: True if FFmpeg wrote the GIF, False if it is missing or failed
+    """
+    width, height = frames[0].size
+    fps = 1000 * len(durations) / max(int(durations.sum()), 1)
+    paletteuse = "paletteuse=dither=bayer:bayer_scale=5" if dither else "paletteuse=dither=none"
+
+    if not _HAS_FFMPEG:
+        return False
+
+    try:
+        subprocess.run([
+            _FFMPEG_PATH,
+            "-y",
+            "-filter_threads", str(os.cpu_count() or 1),
+            "-f", "rawvideo",
+            "-pix_fmt", "rgb24",
+            "-s", f"{width}x{height}",
+            "-r", f"{fps:.3f}",
+            "-i", "pipe:0",
+            "-vf", f"split[a][b];[a]palettegen=max_colors={max(colors, 4)}[p];[b][p]{paletteuse}",
+            "-loop", str(loop),
+            "-f", "gif",
+            output_path
+        ], input=b"".join(frame.convert("RGB").tobytes() for frame in frames),
+           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        return True
+    except (subprocess.SubprocessError, FileNotFoundError):
+        return False
+
+
+def _quantize_frame(frame, colors, dither):
+    """
+    Quantize one frame to its own palette.
+    
+    When dithering is wanted and fewer than 64 colors are left, an ordered
+    Bayer dither is used: it is cheap to compute, and its fixed 8x8 pattern
+    repeats identically across scanlines and frames, so LZW still finds
+    matches, unlike error-diffusion noise.
+    
+    Args:
+        frame (PIL.Image): RGBA frame
+        colors (int): Number of colors
+        dither (int): Pillow dither mode requested for this frame
+        
+    Returns:
+        PIL.Image: The paletted frame
+    """
+    quantized = frame.quantize(colors=colors, method=Image.FASTOCTREE, dither=dither)
+    if dither != Image.NONE and colors < 64 and frame.getextrema()[3][0] == 255:
+        quantized = _bayer_dither(frame.convert("RGB"), quantized, colors)
+    return quantized
 
-            # Quantize to reduce colors
-            converted = converted.quantize(colors=colors, method=2, dither=dither)
 
-            # Save frame info
-            frames.append(converted)
+def _bayer_matrix(size):
+    """Return a size x size Bayer threshold matrix with values in (0, 1)."""
+    matrix = np.array([[0, 2], [3, 1]])
+    while len(matrix) < size:
+        matrix = np.block([[4 * matrix, 4 * matrix + 2], [4 * matrix + 3, 4 * matrix + 1]])
+    return (matrix + 0.5) / matrix.size
+
+
+_BAYER8 = _bayer_matrix(8)
+
+
+def _bayer_dither(frame, palette_image, colors):
+    """
+    Map an RGB frame onto a palette with 8x8 ordered (Bayer) dithering.
+    
+    Args:
+        frame (PIL.Image): RGB frame
+        palette_image (PIL.Image): Paletted image whose palette to map onto
+        colors (int): Palette size, which sets the dither amplitude
+        
+    Returns:
+        PIL.Image: The dithered, paletted frame
+    """
+    pixels = np.asarray(frame, dtype=np.float32)
+    height, width = pixels.shape[:2]
+    pixels += _bayer_offsets(height, width, colors)
+    np.clip(pixels, 0, 255, out=pixels)
+    noisy = Image.fromarray(pixels.astype(np.uint8), "RGB")
+    return noisy.quantize(palette=palette_image, dither=Image.NONE)
+
+
+@functools.lru_cache(maxsize=8)
+def _bayer_offsets(height, width, colors):
+    """Return the per-pixel dither offsets for a frame size, shared by all frames."""
+    threshold = _BAYER8[np.arange(height)[:, None] % 8, np.arange(width) % 8]
+
+    # Offset each pixel by up to half the typical gap between palette colors
+    spread = 128 / colors ** (1 / 3)
+    offsets = ((threshold - 0.5) * spread).astype(np.float32)[..., None]
+    offsets.flags.writeable = False
+    return offsets
+
+
+def _share_palette(input_path, output_path, colors=256):
+    """
+    Remap every frame of a GIF onto one shared palette.
+
+    GIFs with transparency are copied unchanged, since the shared palette
+    has no transparent entry.
+    
+    Args:
+        input_path (str): Path to input GIF
+        output_path (str): Path to save the remapped GIF
+        colors (int): Number of colors in the shared palette
+    """
+    with Image.open(input_path) as img:
+        frames = []
+        durations = []
+        disposals = []
+        
+        # Process each frame
+        for frame in ImageSequence.Iterator(img):
+            frames.append(frame.convert("RGBA"))
             durations.append(frame.info.get("duration", 100))
             disposals.append(
                 frame.disposal_method if hasattr(frame, "disposal_method") else 2
             )
-
-        # Save the optimized GIF
+        
+        if not frames or _has_transparency(frames):
+            shutil.copy(input_path, output_path)
+            return
+        
+        rgb_frames = [frame.convert("RGB") for frame in frames]
+        master = _build_shared_palette(rgb_frames, colors)
+        frames = [
+            frame.quantize(palette=master, dither=Image.NONE) for frame in rgb_frames
+        ]
+        
+        # Save with the shared palette as the global color table
         frames[0].save(
             output_path,
             format="GIF",
             append_images=frames[1:],
             save_all=True,
-            optimize=True,
+            optimize=False,  # Don't optimize yet
             duration=durations,
             disposal=disposals,
             loop=img.info.get("loop", 0),
+            palette=master.getpalette(),
         )
 
 
+def _build_shared_palette(frames, colors=256, max_samples=16):
+    """
+    Build one palette for a set of frames by quantizing them together.
+
+    Only every n-th frame is used, so that at most about max_samples frames
+    are quantized; consecutive frames share most of their colors.
+
+    Args:
+        frames (list): RGB frames of equal size
+        colors (int): Number of palette entries
+        max_samples (int): Roughly how many frames to sample
+
+    Returns:
+        Image: Palette-mode image to pass as quantize(palette=...)
+    """
+    frames = frames[::max(1, len(frames) // max_samples)]
+    width, height = frames[0].size
+    mosaic = Image.new("RGB", (width, height * len(frames)))
+    for i, frame in enumerate(frames):
+        mosaic.paste(frame, (0, i * height))
+    return mosaic.quantize(colors=colors, method=Image.FASTOCTREE)
+
+
+def _delta_encode(frames, palette):
+    """
+    Replace pixels that did not change since the previous frame with index 0.
+
+    Long runs of a single transparent index collapse to very few LZW codes,
+    so mostly static animations shrink considerably. The frames must be
+    saved with transparency=0 and disposal 1 (do not dispose).
+
+    Args:
+        frames (list): Palette-mode frames quantized against `palette`
+        palette (list): Shared palette as flat RGB values, at most 255 entries
+
+    Returns:
+        tuple: Delta-encoded frames and their palette, shifted up by one index
+    """
+    shifted_palette = [0, 0, 0] + palette[:255 * 3]
+    delta_frames = []
+
+    # Reuse two index buffers and one mask across frames, swapping the index
+    # buffers each frame; only the delta itself, which the frame image
+    # keeps, is allocated per frame
+    width, height = frames[0].size
+    indices = np.empty((height, width), dtype=np.uint8)
+    previous = np.empty_like(indices)
+    unchanged = np.empty((height, width), dtype=bool)
+    for i, frame in enumerate(frames):
+        # Shift every index up by one to free index 0
+        np.add(np.asarray(frame, dtype=np.uint8), 1, out=indices)
+        delta = indices.copy()
+        if i:
+            np.equal(indices, previous, out=unchanged)
+            delta[unchanged] = 0
+        indices, previous = previous, indices
+
+        delta_frame = Image.fromarray(delta)
+        delta_frame.putpalette(shifted_palette)
+        delta_frames.append(delta_frame)
+
+    return delta_frames, shifted_palette
+
+
+def _has_transparency(frames):
+    """Check whether any RGBA frame has pixels that are not fully opaque."""
+    return any(frame.getextrema()[3][0] < 255 for frame in frames)
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Compress GIF files to approximately 1MB"
@@ -595,12 +1380,32 @@ def main():
         default=10,
         help="Maximum compression attempts",
     )
+    parser.add_argument(
+        "-t",
+        "--tolerance",
+        type=float,
+        default=0.05,
+        help="Stop once within this fraction below the target size (default: 0.05)",
+    )
+    parser.add_argument(
+        "--early-stop",
+        type=float,
+        default=0.02,
+        help="Stop once the last three attempts differ in size by less than this fraction (0 = never, default: 0.02)",
+    )
     parser.add_argument(
         "-b",
         "--batch",
         action="store_true",
         help="Process all GIFs in the input directory",
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of GIFs to compress in parallel in batch mode (default: CPU count)",
+    )
     
     # Add advanced options
     adv_group = parser.add_argument_group("Advanced Options")
@@ -640,6 +1445,38 @@ def main():
         metavar=("LEFT", "TOP", "RIGHT", "BOTTOM"),
         help="Crop pixels from each edge (e.g. --crop 10 10 10 10)"
     )
+    adv_group.add_argument(
+        "--max-lossy", 
+        type=int, 
+        default=200, 
+        help="Highest gifsicle lossy LZW level to try (0-200, default: 200)"
+    )
+    adv_group.add_argument(
+        "--shared-palette", 
+        action="store_true", 
+        help="Quantize all frames against one global palette"
+    )
+    adv_group.add_argument(
+        "--delta-frames", 
+        action="store_true", 
+        help="Make pixels unchanged since the previous frame transparent (Pillow fallback)"
+    )
+    adv_group.add_argument(
+        "--smooth", 
+        action="store_true", 
+        help="Median-filter frames before compressing so LZW finds longer runs"
+    )
+    adv_group.add_argument(
+        "--ffmpeg-encoder", 
+        action="store_true", 
+        help="Encode with FFmpeg's palettegen/paletteuse instead of Pillow (Pillow fallback)"
+    )
+    adv_group.add_argument(
+        "--near-dup", 
+        type=float, 
+        default=0.0, 
+        help="Merge frames where at most this fraction of pixels changed (0-1, default: 0 = identical only)"
+    )
 
     args = parser.parse_args()
 
@@ -656,25 +1493,52 @@ def main():
         else:
             args.output = args.input
 
-        # Process all GIF files
-        for filename in os.listdir(args.input):
-            if filename.lower().endswith(".gif"):
-                input_path = os.path.join(args.input, filename)
-                output_path = os.path.join(args.output, filename)
-
+        filenames = [
+            filename for filename in os.listdir(args.input)
+            if filename.lower().endswith(".gif")
+        ]
+        jobs = max(1, min(args.jobs, len(filenames)))
+        options = dict(
+            min_colors=args.min_colors,
+            min_scale=args.min_scale,
+            force_scaling=args.force_scaling,
+            frame_sample_rate=args.frame_sample,
+            duration_factor=args.duration_factor,
+            crop_pixels=args.crop,
+            max_lossy=args.max_lossy,
+            shared_palette=args.shared_palette,
+            delta_frames=args.delta_frames,
+            smooth=args.smooth,
+            ffmpeg_encoder=args.ffmpeg_encoder,
+            near_dup_tol=args.near_dup,
+            target_tolerance=args.tolerance,
+            early_stop_tol=args.early_stop,
+            # Split the cores between files compressed at the same time
+            workers=max(1, (os.cpu_count() or 1) // jobs),
+        )
+        tasks = [
+            (
+                filename,
+                os.path.join(args.input, filename),
+                os.path.join(args.output, filename),
+                args.size,
+                args.max_attempts,
+                options,
+            )
+            for filename in filenames
+        ]
+
+        # Process all GIF files, several at once when --jobs allows it. Each
+        # file's output is collected and printed in one piece so files
+        # running in parallel don't interleave their progress lines.
+        if jobs > 1:
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                for output in executor.map(_process_file_captured, tasks):
+                    print(output, end="")
+        else:
+            for filename, input_path, output_path, size, attempts, options in tasks:
                 print(f"Processing {filename}...")
-                process_file(
-                    input_path, 
-                    output_path, 
-                    args.size, 
-                    args.max_attempts,
-                    min_colors=args.min_colors,
-                    min_scale=args.min_scale,
-                    force_scaling=args.force_scaling,
-                    frame_sample_rate=args.frame_sample,
-                    duration_factor=args.duration_factor,
-                    crop_pixels=args.crop
-                )
+                process_file(input_path, output_path, size, attempts, **options)
     else:
         # Process single file
         if not args.output:
@@ -691,7 +1555,15 @@ def main():
             force_scaling=args.force_scaling,
             frame_sample_rate=args.frame_sample,
             duration_factor=args.duration_factor,
-            crop_pixels=args.crop
+            crop_pixels=args.crop,
+            max_lossy=args.max_lossy,
+            shared_palette=args.shared_palette,
+            delta_frames=args.delta_frames,
+            smooth=args.smooth,
+            ffmpeg_encoder=args.ffmpeg_encoder,
+            near_dup_tol=args.near_dup,
+            target_tolerance=args.tolerance,
+            early_stop_tol=args.early_stop
         )
 
 
@@ -705,7 +1577,16 @@ def process_file(
     force_scaling=False,
     frame_sample_rate=1.0,
     duration_factor=1.0,
-    crop_pixels=None
+    crop_pixels=None,
+    max_lossy=200,
+    shared_palette=False,
+    delta_frames=False,
+    smooth=False,
+    ffmpeg_encoder=False,
+    near_dup_tol=0.0,
+    target_tolerance=0.05,
+    early_stop_tol=0.02,
+    workers=None
 ):
     """Process a single GIF file"""
     try:
@@ -719,7 +1600,16 @@ def process_file(
             force_scaling=force_scaling,
             frame_sample_rate=frame_sample_rate,
             duration_factor=duration_factor,
-            crop_pixels=crop_pixels
+            crop_pixels=crop_pixels,
+            max_lossy=max_lossy,
+            shared_palette=shared_palette,
+            delta_frames=delta_frames,
+            smooth=smooth,
+            ffmpeg_encoder=ffmpeg_encoder,
+            near_dup_tol=near_dup_tol,
+            target_tolerance=target_tolerance,
+            early_stop_tol=early_stop_tol,
+            workers=workers
         )
 
         # Calculate compression ratio
@@ -735,5 +1625,15 @@ def process_file(
         print(f"Error compressing GIF: {e}")
 
 
+def _process_file_captured(task):
+    """Run process_file for a batch task and return everything it printed."""
+    filename, input_path, output_path, target_size_mb, max_attempts, options = task
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        print(f"Processing {filename}...")
+        process_file(input_path, output_path, target_size_mb, max_attempts, **options)
+    return output.getvalue()
+
+
 if __name__ == "__main__":
     main()
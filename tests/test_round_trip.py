@@ -0,0 +1,63 @@
+"""Round-trip checks: decode the compressed GIF and compare it to the source."""
+
+import os
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+
+def _make_gif(path, frame_count=6, size=64):
+    """Write a small animation with a moving square over a static gradient."""
+    gradient = np.linspace(0, 255, size, dtype=np.uint8)
+    background = np.stack(np.broadcast_arrays(
+        gradient[None, :], gradient[:, None], np.full((size, size), 128, np.uint8)
+    ), axis=-1)
+    frames = []
+    for i in range(frame_count):
+        pixels = background.copy()
+        pixels[8:24, 4 + i * 6:20 + i * 6] = (255, 32, 32)
+        frames.append(Image.fromarray(pixels))
+    frames[0].save(
+        path, save_all=True, append_images=frames[1:], duration=80, loop=0
+    )
+
+
+class CompressFramesRoundTripTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self.temp_dir.name, "source.gif")
+        self.output = os.path.join(self.temp_dir.name, "output.gif")
+        _make_gif(self.source)
+        self.decoded = main._decode_gif(self.source)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def assertRoundTrip(self, **kwargs):
+        main._compress_frames(self.decoded, self.output, colors=64, **kwargs)
+        source = self.decoded[0][..., :3].astype(np.int16)
+        result = main._decode_gif(self.output)[0][..., :3].astype(np.int16)
+        self.assertEqual(len(result), len(source))
+        for index, (expected, actual) in enumerate(zip(source, result)):
+            error = np.abs(expected - actual).mean()
+            self.assertLess(error, 8, f"frame {index} differs by {error:.1f}")
+
+    def test_per_frame_palette(self):
+        self.assertRoundTrip()
+
+    def test_shared_palette(self):
+        self.assertRoundTrip(shared_palette=True)
+
+    def test_delta_frames(self):
+        self.assertRoundTrip(delta_frames=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
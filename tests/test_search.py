@@ -0,0 +1,147 @@
+"""Checks for the compression level search in compress_gif."""
+
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+
+class SettingsForQualityTest(unittest.TestCase):
+    def test_settings_get_more_aggressive_with_q(self):
+        for force_scaling in (False, True):
+            with self.subTest(force_scaling=force_scaling):
+                settings = [
+                    main._settings_for_quality(q / 100, 32, 0.4, 200, force_scaling)
+                    for q in range(101)
+                ]
+                for (lossy, colors, scale), (next_lossy, next_colors, next_scale) in zip(
+                    settings, settings[1:]
+                ):
+                    self.assertLessEqual(lossy, next_lossy)
+                    self.assertGreaterEqual(colors, next_colors)
+                    self.assertGreaterEqual(scale, next_scale)
+                self.assertEqual(settings[0], (0, 256, 1.0))
+                self.assertEqual(settings[-1], (200, 32, 0.4))
+
+
+class PredictLevelTest(unittest.TestCase):
+    def test_missing_sizes_fall_back_to_bisection(self):
+        self.assertIsNone(main._predict_level(0.2, 0.6, None, 500, 800))
+        self.assertIsNone(main._predict_level(0.2, 0.6, 1000, None, 800))
+        self.assertIsNone(main._predict_level(0.2, 0.6, 0, 500, 800))
+
+    def test_non_decreasing_sizes_fall_back_to_bisection(self):
+        self.assertIsNone(main._predict_level(0.2, 0.6, 500, 500, 400))
+        self.assertIsNone(main._predict_level(0.2, 0.6, 500, 1000, 400))
+
+    def test_interpolates_log_size(self):
+        # log(1000 / 100) is half of log(1000 / 10)
+        self.assertAlmostEqual(main._predict_level(0.2, 0.6, 1000, 10, 100), 0.4)
+
+    def test_clamps_to_inner_80_percent(self):
+        self.assertAlmostEqual(main._predict_level(0.2, 0.6, 1000, 10, 1), 0.56)
+        self.assertAlmostEqual(main._predict_level(0.2, 0.6, 1000, 10, 999), 0.24)
+        self.assertAlmostEqual(main._predict_level(0.2, 0.6, 1000, 10, 5000), 0.24)
+
+
+class SearchTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self.temp_dir.name, "source.gif")
+        self.output = os.path.join(self.temp_dir.name, "output.gif")
+        noise = np.random.default_rng(0).integers(0, 256, (4, 32, 32, 3), np.uint8)
+        frames = [Image.fromarray(pixels) for pixels in noise]
+        frames[0].save(self.source, save_all=True, append_images=frames[1:])
+        self.original_size = os.path.getsize(self.source)
+        self.calls = []
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _search(self, size_for, target_size, **kwargs):
+        """Run compress_gif with attempts replaced by size_for(settings)."""
+
+        def attempt(input_path, output_path, lossy, colors, scale, *args):
+            self.calls.append((lossy, colors, scale))
+            size = size_for((lossy, colors, scale))
+            with open(output_path, "wb") as f:
+                f.write(b"\0" * size)
+            return size
+
+        with mock.patch.object(main, "_compress_attempt", attempt), \
+                mock.patch.object(main, "_HAS_GIFSICLE", False), \
+                contextlib.redirect_stdout(io.StringIO()):
+            return main.compress_gif(
+                self.source,
+                self.output,
+                target_size_mb=target_size / 1024 / 1024,
+                workers=1,
+                early_stop_tol=0,
+                **kwargs,
+            )
+
+    def _smooth_size(self, settings):
+        """Output size that falls steadily as the settings get more aggressive."""
+        lossy, colors, scale = settings
+        return int(
+            self.original_size * scale ** 2 * (0.5 + colors / 512) * (1 - lossy / 400)
+        )
+
+    def test_respects_max_attempts(self):
+        target_size = self.original_size // 3
+        for max_attempts in (1, 2, 3, 5):
+            with self.subTest(max_attempts=max_attempts):
+                self.calls = []
+                _, new_size = self._search(
+                    self._smooth_size,
+                    target_size,
+                    max_attempts=max_attempts,
+                    target_tolerance=0,
+                )
+                self.assertLessEqual(len(self.calls), max_attempts)
+                self.assertEqual(len(self.calls), len(set(self.calls)))
+                self.assertEqual(new_size, os.path.getsize(self.output))
+
+    def test_stops_within_tolerance(self):
+        target_size = self.original_size // 3
+        _, new_size = self._search(
+            self._smooth_size, target_size, max_attempts=20, target_tolerance=0.1
+        )
+        self.assertLessEqual(new_size, target_size)
+        self.assertGreaterEqual(new_size, target_size * 0.9)
+        # No more attempts once one lands within tolerance
+        sizes = [self._smooth_size(settings) for settings in self.calls]
+        self.assertLessEqual(sizes[-1], target_size)
+        self.assertGreaterEqual(sizes[-1], target_size * 0.9)
+        self.assertFalse(
+            any(target_size * 0.9 <= size <= target_size for size in sizes[:-1])
+        )
+
+    def test_stops_when_interval_collapses(self):
+        # Only the most aggressive settings reach the target, so the search
+        # narrows onto q=1 until no other settings fit in the interval
+        target_size = self.original_size // 3
+        most_aggressive = main._settings_for_quality(1.0, 32, 0.4, 200, False)
+
+        def size_for(settings):
+            return target_size // 2 if settings == most_aggressive else target_size * 2
+
+        _, new_size = self._search(
+            size_for, target_size, max_attempts=50, target_tolerance=0
+        )
+        self.assertLess(len(self.calls), 50)
+        self.assertEqual(new_size, target_size // 2)
+
+
+if __name__ == "__main__":
+    unittest.main()